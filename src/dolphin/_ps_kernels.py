@@ -0,0 +1,214 @@
+"""Compiled kernels used by [dolphin.ps][] to compute the PS statistics."""
+
+from __future__ import annotations
+
+from math import isnan, sqrt
+
+import numba
+import numpy as np
+from numba import cuda
+from numpy.typing import ArrayLike
+
+# (rows, cols) of the sub-tiles processed by one thread.
+# The per-tile accumulators (count, mean, M2 = 20 bytes/pixel) are ~320 KiB,
+# small enough to stay in L2 while all bands stream through them.
+TILE_SHAPE = (128, 128)
+
+
+@numba.njit(parallel=True, nogil=True)
+def ps_block(
+    slc_block: ArrayLike,
+    amp_dispersion_threshold: float,
+    min_count: int,
+    ps_nodata: int,
+    mean_out: np.ndarray,
+    amp_disp_out: np.ndarray,
+    ps_out: np.ndarray,
+):
+    """Compute the amplitude mean, dispersion and PS label for a block.
+
+    Each pixel is visited once: the magnitude, the Welford running mean/variance
+    over the band axis, and the thresholding are fused into one loop, so the 3D
+    block is only read a single time.
+
+    The block is split into `TILE_SHAPE` sub-tiles which are processed in
+    parallel. Within a tile, all bands are accumulated before moving on, so the
+    band data is read with unit stride and the accumulators stay cache-resident.
+
+    Parameters
+    ----------
+    slc_block : ArrayLike
+        3D stack of (complex or real) data, shape (nbands, rows, cols).
+        NaN values are treated as invalid.
+    amp_dispersion_threshold : float
+        Pixels with amplitude dispersion below this value are labeled as PS.
+    min_count : int
+        Minimum number of valid bands needed to compute the dispersion.
+        Pixels with fewer are given an amplitude dispersion of 0 (nodata).
+    ps_nodata : int
+        Value to write into `ps_out` for pixels with no valid dispersion.
+    mean_out : np.ndarray
+        Output (rows, cols) amplitude mean. 0 where no bands were valid.
+    amp_disp_out : np.ndarray
+        Output (rows, cols) amplitude dispersion. 0 for invalid pixels.
+    ps_out : np.ndarray
+        Output (rows, cols) PS labels: 1 for PS, 0 for non-PS, `ps_nodata`
+        for invalid pixels.
+
+    """
+    _, rows, cols = slc_block.shape
+    tile_rows, tile_cols = TILE_SHAPE
+    num_tile_rows = (rows + tile_rows - 1) // tile_rows
+    num_tile_cols = (cols + tile_cols - 1) // tile_cols
+
+    for tile_idx in numba.prange(num_tile_rows * num_tile_cols):
+        r_start = (tile_idx // num_tile_cols) * tile_rows
+        c_start = (tile_idx % num_tile_cols) * tile_cols
+        r_end = min(r_start + tile_rows, rows)
+        c_end = min(c_start + tile_cols, cols)
+        _ps_tile(
+            slc_block,
+            r_start,
+            r_end,
+            c_start,
+            c_end,
+            amp_dispersion_threshold,
+            min_count,
+            ps_nodata,
+            mean_out,
+            amp_disp_out,
+            ps_out,
+        )
+
+
+@numba.njit(nogil=True)
+def _ps_tile(
+    slc_block,
+    r_start,
+    r_end,
+    c_start,
+    c_end,
+    amp_dispersion_threshold,
+    min_count,
+    ps_nodata,
+    mean_out,
+    amp_disp_out,
+    ps_out,
+):
+    nbands = slc_block.shape[0]
+    count = np.zeros((r_end - r_start, c_end - c_start), dtype=np.int32)
+    mean = np.zeros((r_end - r_start, c_end - c_start), dtype=np.float64)
+    m2 = np.zeros((r_end - r_start, c_end - c_start), dtype=np.float64)
+
+    for b in range(nbands):
+        for i in range(r_end - r_start):
+            for j in range(c_end - c_start):
+                v = abs(slc_block[b, r_start + i, c_start + j])
+                if isnan(v):
+                    continue
+                count[i, j] += 1
+                delta = v - mean[i, j]
+                mean[i, j] += delta / count[i, j]
+                m2[i, j] += delta * (v - mean[i, j])
+
+    for i in range(r_end - r_start):
+        for j in range(c_end - c_start):
+            amp_disp, is_ps = _label_pixel(
+                count[i, j],
+                mean[i, j],
+                m2[i, j],
+                amp_dispersion_threshold,
+                min_count,
+                ps_nodata,
+            )
+            r, c = r_start + i, c_start + j
+            mean_out[r, c] = mean[i, j]
+            amp_disp_out[r, c] = amp_disp
+            ps_out[r, c] = is_ps
+
+
+@numba.njit(nogil=True)
+def _label_pixel(count, mean, m2, amp_dispersion_threshold, min_count, ps_nodata):
+    """Get the (amplitude dispersion, PS label) from one pixel's Welford stats."""
+    amp_disp = 0.0
+    if count >= min_count and mean > 0:
+        amp_disp = sqrt(m2 / count) / mean
+    if amp_disp == 0:
+        return amp_disp, ps_nodata
+    return amp_disp, int(amp_disp < amp_dispersion_threshold)
+
+
+def ps_block_gpu(
+    slc_block: ArrayLike,
+    amp_dispersion_threshold: float,
+    min_count: int,
+    ps_nodata: int,
+    mean_out: np.ndarray,
+    amp_disp_out: np.ndarray,
+    ps_out: np.ndarray,
+):
+    """Compute the amplitude mean, dispersion and PS label for a block on the GPU.
+
+    Same interface as [`ps_block`][dolphin._ps_kernels.ps_block]: the block is
+    copied to the device, one thread computes each output pixel, and the results
+    are copied back into `mean_out`, `amp_disp_out` and `ps_out`.
+    """
+    rows, cols = mean_out.shape
+    d_slc_block = cuda.to_device(np.ascontiguousarray(slc_block))
+    d_mean = cuda.device_array(mean_out.shape, dtype=mean_out.dtype)
+    d_amp_disp = cuda.device_array(amp_disp_out.shape, dtype=amp_disp_out.dtype)
+    d_ps = cuda.device_array(ps_out.shape, dtype=ps_out.dtype)
+
+    threads_per_block = (16, 16)
+    blocks_x = (cols + threads_per_block[0] - 1) // threads_per_block[0]
+    blocks_y = (rows + threads_per_block[1] - 1) // threads_per_block[1]
+    _ps_block_cuda[(blocks_x, blocks_y), threads_per_block](
+        d_slc_block,
+        amp_dispersion_threshold,
+        min_count,
+        ps_nodata,
+        d_mean,
+        d_amp_disp,
+        d_ps,
+    )
+    d_mean.copy_to_host(mean_out)
+    d_amp_disp.copy_to_host(amp_disp_out)
+    d_ps.copy_to_host(ps_out)
+
+
+@cuda.jit
+def _ps_block_cuda(
+    slc_block,
+    amp_dispersion_threshold,
+    min_count,
+    ps_nodata,
+    mean_out,
+    amp_disp_out,
+    ps_out,
+):
+    # Get the global position within the 2D GPU grid
+    j, i = cuda.grid(2)
+    nbands, rows, cols = slc_block.shape
+    # Check if we are within the bounds of the array
+    if i >= rows or j >= cols:
+        return
+
+    # The band loop runs in registers; adjacent threads read adjacent pixels
+    n = 0
+    mean = 0.0
+    m2 = 0.0
+    for b in range(nbands):
+        v = abs(slc_block[b, i, j])
+        if isnan(v):
+            continue
+        n += 1
+        delta = v - mean
+        mean += delta / n
+        m2 += delta * (v - mean)
+
+    amp_disp, is_ps = _label_pixel(
+        n, mean, m2, amp_dispersion_threshold, min_count, ps_nodata
+    )
+    mean_out[i, j] = mean
+    amp_disp_out[i, j] = amp_disp
+    ps_out[i, j] = is_ps
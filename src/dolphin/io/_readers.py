@@ -685,6 +685,9 @@ class VRTStack(StackReader):
     file_date_fmt : str, optional (default = "%Y%m%d")
         Format string for parsing the dates from the filenames.
         Passed to [opera_utils.get_dates][].
+    num_threads : int, optional (default = 1)
+        Number of threads to use when reading a block of the stack.
+        If > 1, each band is read in a separate thread.
 
     """
 
@@ -885,13 +888,15 @@ class VRTStack(StackReader):
             n = slice(None)
 
         bands = list(range(1, 1 + len(self)))[n]
-        if len(bands) == len(self):
+        if len(bands) == len(self) and (self.num_threads == 1 or len(self) == 1):
             # This will use gdal's ds.ReadAsRaster, no iteration needed
             data = self.read_stack(band=None, rows=rows, cols=cols)
         else:
-            # Get only the bands we need
+            # `np.stack` would drop the masks of the separate band reads
+            stack = np.ma.stack if self._read_masked else np.stack
+            # Get only the bands we need (reading in parallel if requested)
             if self.num_threads == 1:
-                data = np.stack(
+                data = stack(
                     [self.read_stack(band=i, rows=rows, cols=cols) for i in bands],
                     axis=0,
                 )
@@ -900,7 +905,7 @@ class VRTStack(StackReader):
                     results = executor.map(
                         lambda i: self.read_stack(band=i, rows=rows, cols=cols), bands
                     )
-                data = np.stack(list(results), axis=0)
+                data = stack(list(results), axis=0)
 
         return data
 
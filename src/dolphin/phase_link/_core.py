@@ -6,6 +6,7 @@ from functools import partial
 from typing import NamedTuple, Optional
 
 import jax.numpy as jnp
+import numba
 import numpy as np
 from jax import Array, jit, lax, vmap
 from jax.scipy.linalg import cho_factor, cho_solve, eigh
@@ -489,7 +490,7 @@ def eigh_largest_stack(C_arrays: ArrayLike) -> tuple[Array, Array]:
     return vmap(vmap(_get_largest_eigenpair))(C_arrays)
 
 
-def decimate(arr: ArrayLike, strides: Strides) -> Array:
+def decimate(arr: ArrayLike, strides: Strides, contiguous: bool = False) -> Array:
     """Decimate an array by strides in the x and y directions.
 
     Output will match [`io.compute_out_shape`][dolphin.io.compute_out_shape]
@@ -500,12 +501,23 @@ def decimate(arr: ArrayLike, strides: Strides) -> Array:
         2D or 3D array to decimate.
     strides : dict[str, int]
         The strides in the x and y directions.
+    contiguous : bool, optional
+        If True, copy the decimated pixels of a numpy `arr` into a new
+        C-contiguous array using multiple threads. Useful when the output is read
+        multiple times, since each read of the strided view only uses a fraction
+        of every cache line loaded. Default is False (return a view).
 
     Returns
     -------
     ArrayLike
         The decimated array.
 
+    Raises
+    ------
+    ValueError
+        If `contiguous` is True and `arr` is not a 2D or 3D numpy array
+        (e.g. a JAX array).
+
     """
     ys, xs = strides
     rows, cols = arr.shape[-2:]
@@ -513,7 +525,40 @@ def decimate(arr: ArrayLike, strides: Strides) -> Array:
     start_c = xs // 2
     end_r = (rows // ys) * ys + 1
     end_c = (cols // xs) * xs + 1
-    return arr[..., start_r:end_r:ys, start_c:end_c:xs]
+    decimated = arr[..., start_r:end_r:ys, start_c:end_c:xs]
+    if not contiguous:
+        return decimated
+    if not isinstance(arr, np.ndarray) or arr.ndim not in (2, 3):
+        msg = (
+            "contiguous=True requires a 2D or 3D numpy array, got"
+            f" {type(arr).__name__} with shape {arr.shape}"
+        )
+        raise ValueError(msg)
+    if decimated.size == 0:
+        return decimated
+
+    out = np.empty(decimated.shape, dtype=arr.dtype)
+    _decimate_copy(
+        arr.reshape(-1, rows, cols),
+        start_r,
+        start_c,
+        ys,
+        xs,
+        out.reshape(-1, *decimated.shape[-2:]),
+    )
+    return out
+
+
+@numba.njit(parallel=True, nogil=True)
+def _decimate_copy(arr, start_r, start_c, ys, xs, out):
+    # Each thread fills whole output rows, so the writes are sequential
+    nbands, out_rows, out_cols = out.shape
+    for idx in numba.prange(nbands * out_rows):
+        b = idx // out_rows
+        i = idx % out_rows
+        r = start_r + i * ys
+        for j in range(out_cols):
+            out[b, i, j] = arr[b, r, start_c + j * xs]
 
 
 def _raise_if_all_nan(slc_stack: np.ndarray):
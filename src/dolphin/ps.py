@@ -2,16 +2,17 @@
 
 from __future__ import annotations
 
+import math
 import shutil
-import warnings
+from contextlib import contextmanager
 from pathlib import Path
-from typing import Optional
+from typing import Optional, Sequence
 
 import numpy as np
 from numpy.typing import ArrayLike
 from osgeo import gdal
 
-from dolphin import io, utils
+from dolphin import _ps_kernels, io, utils
 from dolphin._log import get_log
 from dolphin._types import Filename
 from dolphin.io import EagerLoader, StackReader
@@ -38,6 +39,9 @@ def create_ps(
     nodata_mask: Optional[np.ndarray] = None,
     update_existing: bool = False,
     block_shape: tuple[int, int] = (512, 512),
+    num_threads: int = 1,
+    max_gdal_cache_bytes: Optional[int] = None,
+    use_gpu: bool = False,
     **tqdm_kwargs,
 ):
     """Create the amplitude dispersion, mean, and PS files.
@@ -66,11 +70,32 @@ def create_ps(
     update_existing : bool, optional
         If providing existing amp mean/dispersion files, combine them with the
         data from the current SLC stack.
+        The existing amplitude dispersion file must have an "N" metadata item
+        with the number of SLCs it was made from (as written by `create_ps`).
+        Files made by earlier versions have no "N" item and raise a
+        `ValueError` (before any outputs are created); use
+        `update_existing=False` to reuse them as-is.
+        Pixels which are nodata in the existing files, or which have any
+        invalid (NaN/masked) band in the new SLCs, are nodata in the outputs.
         If False, simply uses the existing files to create as PS mask.
         Default is False.
     block_shape : tuple[int, int], optional
         The 2D block size to load all bands at a time.
+        Rounded down, where possible, to a multiple of the chunk sizes of
+        `like_filename` and the output files.
         Default is (512, 512)
+    num_threads : int, optional
+        Number of threads GDAL may use to decompress the input blocks and
+        compress the outputs (unless `GDAL_NUM_THREADS` is already set).
+        Default is 1.
+    max_gdal_cache_bytes : Optional[int], optional
+        If provided, GDAL's block cache is raised (up to this size) to hold one
+        full row of blocks while processing, so input tiles or strips spanning
+        multiple blocks are not read again.
+        Default is None, which leaves the cache size unchanged.
+    use_gpu : bool, optional
+        Whether to compute the statistics on the GPU, if one is available.
+        Default is False.
     **tqdm_kwargs : optional
         Arguments to pass to `tqdm`, (e.g. `position=n` for n parallel bars)
         See https://tqdm.github.io/docs/tqdm/#tqdm-objects for all options.
@@ -86,9 +111,17 @@ def create_ps(
             output_amp_mean_file=output_amp_mean_file,
             output_amp_dispersion_file=output_amp_dispersion_file,
             amp_dispersion_threshold=amp_dispersion_threshold,
+            block_shape=block_shape,
         )
         return
 
+    # If updating, read the number of SLCs used for the existing statistics.
+    # This is checked first so a bad existing file doesn't leave empty outputs.
+    num_existing = 0
+    if update_existing and existing_amp_dispersion_file and existing_amp_mean_file:
+        num_existing = _get_num_acquisitions(existing_amp_dispersion_file)
+        logger.info(f"Combining new SLCs with {num_existing} existing acquisitions")
+
     # Otherwise, we need to calculate the PS files from the SLC stack
     # Initialize the output files with zeros
     file_list = [output_file, output_amp_dispersion_file, output_amp_mean_file]
@@ -103,8 +136,18 @@ def create_ps(
             dtype=dtype,
             nodata=nodata,
         )
-    # Initialize the intermediate arrays for the calculation
-    magnitude = np.zeros((reader.shape[0], *block_shape), dtype=np.float32)
+
+    # Read whole chunks of the input, and write whole tiles of the outputs
+    block_shape = _align_block_shape(
+        block_shape,
+        [io.get_raster_chunk_size(fn) for fn in [like_filename, *file_list]],
+    )
+
+    # Use the CUDA version of the kernel if requested and a GPU is available
+    if use_gpu and utils.gpu_is_available():
+        ps_kernel = _ps_kernels.ps_block_gpu
+    else:
+        ps_kernel = _ps_kernels.ps_block
 
     skip_empty = nodata_mask is None
 
@@ -116,47 +159,147 @@ def create_ps(
         nodata_mask=nodata_mask,
         skip_empty=skip_empty,
     )
-    for cur_data, (rows, cols) in block_gen.iter_blocks(**tqdm_kwargs):
-        cur_rows, cur_cols = cur_data.shape[-2:]
-
-        if not (np.all(cur_data == 0) or np.all(np.isnan(cur_data))):
-            magnitude_cur = np.abs(cur_data, out=magnitude[:, :cur_rows, :cur_cols])
-            mean, amp_disp, ps = calc_ps_block(
-                # use min_count == size of stack so that ALL need to be not Nan
-                magnitude_cur,
-                amp_dispersion_threshold,
-                min_count=len(magnitude_cur),
-            )
-
+    # Size GDAL's block cache and threads for reading/writing the blocks
+    with _gdal_block_io_settings(
+        reader,
+        block_shape,
+        num_threads=num_threads,
+        max_cache_bytes=max_gdal_cache_bytes,
+    ):
+        for cur_data, (rows, cols) in block_gen.iter_blocks(**tqdm_kwargs):
+            cur_rows, cur_cols = cur_data.shape[-2:]
+            slc_block = _masked_to_nan(cur_data)
+            # Blocks which are all nodata (zeros or NaNs) don't need a separate
+            # check over the whole 3D block: the kernel gives them mean = 0 and
+            # amp. dispersion = 0, and marks them with the PS nodata value.
+            mean = np.empty((cur_rows, cur_cols), dtype=FILE_DTYPES["amp_mean"])
+            amp_disp = np.empty_like(mean, dtype=FILE_DTYPES["amp_dispersion"])
             # Use the UInt8 type for the PS to save.
             # For invalid pixels, set to max Byte value
-            ps = ps.astype(FILE_DTYPES["ps"])
-            ps[amp_disp == 0] = NODATA_VALUES["ps"]
-        else:
-            # Fill the block with nodata
-            ps = (
-                np.ones((cur_rows, cur_cols), dtype=FILE_DTYPES["ps"])
-                * NODATA_VALUES["ps"]
-            )
-            mean = np.full(
-                (cur_rows, cur_cols),
-                NODATA_VALUES["amp_mean"],
-                dtype=FILE_DTYPES["amp_mean"],
+            ps = np.empty_like(mean, dtype=FILE_DTYPES["ps"])
+            ps_kernel(
+                slc_block,
+                amp_dispersion_threshold,
+                # use min_count == size of stack so that ALL need to be not Nan
+                len(slc_block),
+                NODATA_VALUES["ps"],
+                mean,
+                amp_disp,
+                ps,
             )
-            amp_disp = np.full(
-                (cur_rows, cur_cols),
-                NODATA_VALUES["amp_dispersion"],
-                dtype=FILE_DTYPES["amp_dispersion"],
+            if num_existing > 0:
+                # Merge the new block's statistics with the existing ones
+                mean, amp_disp = _merge_amp_stats(
+                    io.load_gdal(existing_amp_mean_file, rows=rows, cols=cols),
+                    io.load_gdal(existing_amp_dispersion_file, rows=rows, cols=cols),
+                    num_existing,
+                    mean,
+                    amp_disp,
+                    len(slc_block),
+                )
+                ps = (amp_disp < amp_dispersion_threshold).astype(FILE_DTYPES["ps"])
+                ps[amp_disp == 0] = NODATA_VALUES["ps"]
+
+            # Write amp dispersion and the mean blocks
+            writer.queue_write(mean, output_amp_mean_file, rows.start, cols.start)
+            writer.queue_write(
+                amp_disp, output_amp_dispersion_file, rows.start, cols.start
             )
+            writer.queue_write(ps, output_file, rows.start, cols.start)
+
+        # Finish the writes while the settings apply to the outputs' compression
+        logger.info(f"Waiting to write {writer.num_queued} blocks of data.")
+        writer.notify_finished()
+    # Record how many SLCs went into the statistics so they can be updated later
+    for fn in [output_amp_mean_file, output_amp_dispersion_file]:
+        io.set_raster_metadata(fn, {"N": num_existing + len(reader)})
+    logger.info("Finished writing out PS files")
 
-        # Write amp dispersion and the mean blocks
-        writer.queue_write(mean, output_amp_mean_file, rows.start, cols.start)
-        writer.queue_write(amp_disp, output_amp_dispersion_file, rows.start, cols.start)
-        writer.queue_write(ps, output_file, rows.start, cols.start)
 
-    logger.info(f"Waiting to write {writer.num_queued} blocks of data.")
-    writer.notify_finished()
-    logger.info("Finished writing out PS files")
+def _masked_to_nan(block: np.ndarray) -> np.ndarray:
+    """Get the data of a block read by the loader, with masked pixels as NaN.
+
+    numba can't use masked arrays, so masked pixels become invalid (NaN).
+    The block was just read from disk, so it is filled in place when possible,
+    rather than making another copy of the whole 3D block with `.filled()`.
+    """
+    if not isinstance(block, np.ma.MaskedArray):
+        return block
+    if block.mask is np.ma.nomask:
+        return block.data
+    if not block.data.flags.writeable:
+        return block.filled(np.nan)
+    data = block.data
+    np.copyto(data, np.nan, where=block.mask)
+    return data
+
+
+def _align_block_shape(
+    block_shape: tuple[int, int], chunk_sizes: Sequence[Sequence[int]]
+) -> tuple[int, int]:
+    """Round `block_shape` down to a multiple of all the files' chunk sizes.
+
+    Parameters
+    ----------
+    block_shape : tuple[int, int]
+        The (rows, cols) of the blocks to process.
+    chunk_sizes : Sequence[Sequence[int]]
+        The (blockXSize, blockYSize) of each file, as returned by
+        [`io.get_raster_chunk_size`][dolphin.io.get_raster_chunk_size].
+
+    Returns
+    -------
+    tuple[int, int]
+        The aligned block shape. Dimensions where the chunks' common multiple is
+        larger than the block (e.g. for files stored in strips) are unchanged.
+
+    """
+    aligned = []
+    for dim, block_size in enumerate(block_shape):
+        # GDAL block sizes are ordered (x, y)
+        multiple = 1
+        for chunk_size in chunk_sizes:
+            c = chunk_size[1 - dim]
+            multiple = multiple * c // math.gcd(multiple, c)
+        aligned.append(
+            block_size if multiple > block_size else block_size // multiple * multiple
+        )
+    if tuple(aligned) != tuple(block_shape):
+        logger.info(f"Aligning {block_shape = } to chunk sizes: {tuple(aligned)}")
+    return aligned[0], aligned[1]
+
+
+@contextmanager
+def _gdal_block_io_settings(
+    reader: StackReader,
+    block_shape: tuple[int, int],
+    num_threads: int = 1,
+    max_cache_bytes: Optional[int] = None,
+):
+    """Temporarily set GDAL's block cache and threads for a block loop.
+
+    If `max_cache_bytes` is given, the cache is raised (if needed, up to that
+    size) to hold one full row of blocks for every band, so input tiles or
+    strips which span multiple blocks are still cached when the neighboring
+    block is read, instead of being read and decompressed again.
+    If `num_threads` > 1, compressed inputs are decoded, and compressed (tiled
+    GeoTIFF) outputs are encoded, using that many threads, unless
+    `GDAL_NUM_THREADS` was already set.
+    """
+    old_cache_max = gdal.GetCacheMax()
+    old_num_threads = gdal.GetConfigOption("GDAL_NUM_THREADS")
+    if max_cache_bytes is not None:
+        nbands, _, ncols = reader.shape
+        itemsize = np.dtype(reader.dtype).itemsize
+        row_of_blocks_bytes = nbands * block_shape[0] * ncols * itemsize
+        gdal.SetCacheMax(max(old_cache_max, min(row_of_blocks_bytes, max_cache_bytes)))
+    if num_threads > 1 and old_num_threads is None:
+        gdal.SetConfigOption("GDAL_NUM_THREADS", str(num_threads))
+    try:
+        yield
+    finally:
+        gdal.SetCacheMax(old_cache_max)
+        gdal.SetConfigOption("GDAL_NUM_THREADS", old_num_threads)
 
 
 def calc_ps_block(
@@ -218,23 +361,101 @@ def calc_ps_block(
     if min_count is None:
         min_count = int(0.9 * stack_mag.shape[0])
 
-    with warnings.catch_warnings():
-        # ignore the warning about nansum/nanmean of empty slice
-        warnings.simplefilter("ignore", category=RuntimeWarning)
+    shape2d = stack_mag.shape[1:]
+    mean = np.empty(shape2d, dtype=np.float32)
+    amp_disp = np.empty(shape2d, dtype=np.float32)
+    ps = np.empty(shape2d, dtype=np.uint8)
+    # The kernel tracks each pixel's valid (non-NaN) count as it goes, so we don't
+    # need separate `nanmean`/`nanstd`/`count_nonzero` passes over the stack.
+    # Invalid pixels get the label 0 (not a PS).
+    _ps_kernels.ps_block(
+        np.asarray(stack_mag),
+        amp_dispersion_threshold,
+        min_count,
+        0,
+        mean,
+        amp_disp,
+        ps,
+    )
+    return mean, amp_disp, ps.astype(bool)
+
 
-        mean = np.nanmean(stack_mag, axis=0)
-        std_dev = np.nanstd(stack_mag, axis=0)
-        count = np.count_nonzero(~np.isnan(stack_mag), axis=0)
-        amp_disp = std_dev / mean
-    # Mask out the pixels with too few valid pixels
-    amp_disp[count < min_count] = np.nan
-    # replace nans/infinities with 0s, which will mean nodata
-    mean = np.nan_to_num(mean, nan=0, posinf=0, neginf=0, copy=False)
-    amp_disp = np.nan_to_num(amp_disp, nan=0, posinf=0, neginf=0, copy=False)
+def _get_num_acquisitions(amp_dispersion_file: Filename) -> int:
+    """Read the number of SLCs used to make `amp_dispersion_file`."""
+    metadata = io.get_raster_metadata(amp_dispersion_file)
+    if "N" not in metadata:
+        msg = (
+            f"{amp_dispersion_file} has no 'N' metadata item; can't combine"
+            " it with new SLCs."
+        )
+        raise ValueError(msg)
+    return int(metadata["N"])
 
-    ps = amp_disp < amp_dispersion_threshold
-    ps[amp_disp == 0] = False
-    return mean, amp_disp, ps
+
+def _merge_amp_stats(
+    mean_a: np.ndarray,
+    amp_disp_a: np.ndarray,
+    n_a: int,
+    mean_b: np.ndarray,
+    amp_disp_b: np.ndarray,
+    n_b: int,
+) -> tuple[np.ndarray, np.ndarray]:
+    """Combine two sets of amplitude mean/dispersion statistics.
+
+    Uses the pairwise update of [@Chan1982UpdatingFormulaeAlgorithms] to merge
+    the (count, mean, sum of squared deviations) of each set, which is exact
+    for the population variance.
+    The sums of squared deviations are rebuilt from the dispersion and mean in
+    float64, so the only rounding is that of the stored (float32) statistics.
+
+    Parameters
+    ----------
+    mean_a : np.ndarray
+        Amplitude mean of the first set of SLCs.
+    amp_disp_a : np.ndarray
+        Amplitude dispersion of the first set of SLCs (0 for nodata).
+    n_a : int
+        Number of SLCs in the first set.
+    mean_b : np.ndarray
+        Amplitude mean of the second set of SLCs.
+    amp_disp_b : np.ndarray
+        Amplitude dispersion of the second set of SLCs (0 for nodata).
+    n_b : int
+        Number of SLCs in the second set.
+
+    Returns
+    -------
+    mean : np.ndarray
+        The amplitude mean of all `n_a + n_b` SLCs.
+        Pixels which are nodata in either set keep `mean_b`.
+    amp_disp : np.ndarray
+        The amplitude dispersion of all `n_a + n_b` SLCs.
+        Pixels which are nodata (0) in either set are set to 0. Note that this
+        includes pixels which were valid in the first set but have a single
+        invalid (e.g. NaN) band in the second set, since the new statistics
+        require all bands to be valid.
+
+    """
+    out_dtype = np.asarray(mean_b).dtype
+    mean_a, amp_disp_a, mean_b, amp_disp_b = (
+        np.asarray(x, dtype=np.float64)
+        for x in (mean_a, amp_disp_a, mean_b, amp_disp_b)
+    )
+    n = n_a + n_b
+    delta = mean_b - mean_a
+    mean = mean_a + delta * (n_b / n)
+    m2 = (amp_disp_a * mean_a) ** 2 * n_a
+    m2 += (amp_disp_b * mean_b) ** 2 * n_b
+    m2 += delta**2 * (n_a * n_b / n)
+    m2 /= n
+    std_dev = np.sqrt(m2, out=m2)
+
+    # Pixels which are nodata in either set can't be combined
+    valid = (amp_disp_a > 0) & (amp_disp_b > 0)
+    amp_disp = np.zeros_like(mean)
+    np.divide(std_dev, mean, out=amp_disp, where=valid & (mean > 0))
+    mean[~valid] = mean_b[~valid]
+    return mean.astype(out_dtype), amp_disp.astype(out_dtype)
 
 
 def _use_existing_files(
@@ -245,18 +466,35 @@ def _use_existing_files(
     output_amp_mean_file: Filename,
     output_amp_dispersion_file: Filename,
     amp_dispersion_threshold: float,
+    block_shape: tuple[int, int],
 ) -> None:
-    amp_disp = io.load_gdal(existing_amp_dispersion_file, masked=True)
-    ps = amp_disp < amp_dispersion_threshold
-    ps = ps.astype(np.uint8)
-    # Set the PS nodata value to the max uint8 value
-    ps[(amp_disp == 0) | amp_disp.mask] = NODATA_VALUES["ps"]
     io.write_arr(
-        arr=ps,
+        arr=None,
         like_filename=existing_amp_dispersion_file,
         output_name=output_file,
+        nbands=1,
+        dtype=FILE_DTYPES["ps"],
         nodata=NODATA_VALUES["ps"],
     )
+    # Threshold one block at a time, rather than loading the whole raster
+    block_shape = _align_block_shape(
+        block_shape,
+        [
+            io.get_raster_chunk_size(fn)
+            for fn in [existing_amp_dispersion_file, output_file]
+        ],
+    )
+    xsize, ysize = io.get_raster_xysize(existing_amp_dispersion_file)
+    for rows, cols in io.iter_blocks((ysize, xsize), block_shape=block_shape):
+        amp_disp = io.load_gdal(
+            existing_amp_dispersion_file, band=1, rows=rows, cols=cols, masked=True
+        )
+        ps = (amp_disp < amp_dispersion_threshold).astype(FILE_DTYPES["ps"])
+        # Set the PS nodata value to the max uint8 value
+        ps[(amp_disp == 0) | amp_disp.mask] = NODATA_VALUES["ps"]
+        io.write_block(
+            ps.filled(NODATA_VALUES["ps"]), output_file, rows.start, cols.start
+        )
     # Copy the existing amp mean file/amp dispersion file
     shutil.copy(existing_amp_dispersion_file, output_amp_dispersion_file)
     shutil.copy(existing_amp_mean_file, output_amp_mean_file)
@@ -2,11 +2,14 @@ from __future__ import annotations
 
 import datetime
 import math
+import os
+import re
 import resource
 import sys
 import warnings
 from collections.abc import Callable
 from concurrent.futures import Executor, Future
+from functools import lru_cache
 from itertools import chain
 from multiprocessing import cpu_count
 from pathlib import Path
@@ -63,14 +66,17 @@ def gdal_to_numpy_type(gdal_type: Union[str, int]) -> np.dtype:
     return np.dtype(gdal_array.GDALTypeCodeToNumericTypeCode(gdal_type))
 
 
+_GDAL_PREFIX_RE = re.compile(r"^(DERIVED_SUBDATASET|NETCDF|HDF)", re.IGNORECASE)
+
+
 def _get_path_from_gdal_str(name: Filename) -> Path:
     s = str(name)
     if s.upper().startswith("DERIVED_SUBDATASET"):
         # like DERIVED_SUBDATASET:AMPLITUDE:slc_filepath.tif
-        p = s.split(":")[-1].strip('"').strip("'")
+        p = s.split(":")[-1].strip("\"'")
     elif ":" in s and (s.upper().startswith("NETCDF") or s.upper().startswith("HDF")):
         # like NETCDF:"slc_filepath.nc":subdataset
-        p = s.split(":")[1].strip('"').strip("'")
+        p = s.split(":")[1].strip("\"'")
     else:
         # Whole thing is the path
         p = str(name)
@@ -79,16 +85,19 @@ def _get_path_from_gdal_str(name: Filename) -> Path:
 
 def _resolve_gdal_path(gdal_str: Filename) -> Filename:
     """Resolve the file portion of a gdal-openable string to an absolute path."""
-    s_clean = str(gdal_str).lstrip('"').lstrip("'").rstrip('"').rstrip("'")
-    prefixes = ["DERIVED_SUBDATASET", "NETCDF", "HDF"]
-    is_gdal_str = any(s_clean.upper().startswith(pre) for pre in prefixes)
-    file_part = str(_get_path_from_gdal_str(s_clean))
+    s_clean = str(gdal_str).strip("\"'")
+    # Relative paths resolve against the current directory, so it's part of the key
+    resolved = _resolve_gdal_str(s_clean, str(Path.cwd()))
+    return resolved if _GDAL_PREFIX_RE.match(s_clean) else Path(resolved)
+
 
-    # strip quotes to add back in after
-    file_part = file_part.strip('"').strip("'")
-    file_part_resolved = Path(file_part).resolve()
-    resolved = s_clean.replace(file_part, str(file_part_resolved))
-    return Path(resolved) if not is_gdal_str else resolved
+@lru_cache(maxsize=4096)
+def _resolve_gdal_str(s_clean: str, cwd: str) -> str:
+    # `resolve()` stats the file system, so repeated lookups of the same
+    # file (e.g. every SLC in a VRTStack) are cached
+    file_part = str(_get_path_from_gdal_str(s_clean)).strip("\"'")
+    file_part_resolved = Path(cwd, file_part).resolve()
+    return s_clean.replace(file_part, str(file_part_resolved))
 
 
 def _get_slices(half_r: int, half_c: int, r: int, c: int, rows: int, cols: int):
@@ -129,16 +138,21 @@ def full_suffix(filename: Filename):
 
 def disable_gpu():
     """Disable GPU usage."""
-    import os
-
     import jax
 
     os.environ["CUDA_VISIBLE_DEVICES"] = ""
     jax.config.update("jax_platform_name", "cpu")
+    gpu_is_available.cache_clear()
 
 
+@lru_cache(maxsize=1)
 def gpu_is_available() -> bool:
-    """Check if a GPU is available."""
+    """Check if a GPU is available.
+
+    The result is cached, since probing the CUDA runtime (and failing to load
+    it on CPU-only machines) is repeated on every call otherwise.
+    The cache is cleared by `disable_gpu`.
+    """
     # TODO: not sure yet how to check for the jax gpu installation
     try:
         from numba import cuda
@@ -170,7 +184,8 @@ def take_looks(arr, row_looks, col_looks, func_type="nansum", edge_strategy="cut
     Parameters
     ----------
     arr : np.array
-        2D array of an image
+        2D array of an image, or 3D stack of images (looks are taken on
+        the last two dimensions)
     row_looks : int
         the reduction rate in row direction
     col_looks : int
@@ -194,20 +209,6 @@ def take_looks(arr, row_looks, col_looks, func_type="nansum", edge_strategy="cut
     if row_looks == 1 and col_looks == 1:
         return arr
 
-    if arr.ndim >= 3:
-        return np.stack(
-            [
-                take_looks(
-                    a,
-                    row_looks,
-                    col_looks,
-                    func_type=func_type,
-                    edge_strategy=edge_strategy,
-                )
-                for a in arr
-            ]
-        )
-
     if isinstance(arr, np.ma.MaskedArray):
         # Must do looks separately on mask
         # https://github.com/numpy/numpy/issues/8881
@@ -232,30 +233,97 @@ def take_looks(arr, row_looks, col_looks, func_type="nansum", edge_strategy="cut
 
     arr = _make_dims_multiples(arr, row_looks, col_looks, how=edge_strategy)
 
-    rows, cols = arr.shape
+    rows, cols = arr.shape[-2:]
     new_rows = rows // row_looks
     new_cols = cols // col_looks
 
-    func = getattr(np, func_type)
     with warnings.catch_warnings():
         # ignore the warning about nansum of empty slice
         warnings.simplefilter("ignore", category=RuntimeWarning)
+        if _can_accumulate_looks(arr.dtype, func_type):
+            return _accumulate_looks(arr, row_looks, col_looks, func_type)
+        func = getattr(np, func_type)
+        # Any leading (e.g. band) dimensions are kept in the same reshape
         return func(
-            np.reshape(arr, (new_rows, row_looks, new_cols, col_looks)), axis=(3, 1)
+            np.reshape(
+                arr, (*arr.shape[:-2], new_rows, row_looks, new_cols, col_looks)
+            ),
+            axis=(-1, -3),
+        )
+
+
+# Reductions in `take_looks` which can be done one strided slice at a time
+_LOOKS_UFUNCS = {
+    "sum": np.add,
+    "nansum": np.add,
+    "mean": np.add,
+    "nanmean": np.add,
+    "max": np.maximum,
+    "nanmax": np.fmax,
+    "min": np.minimum,
+    "nanmin": np.fmin,
+    "any": np.logical_or,
+    "all": np.logical_and,
+}
+
+
+def _can_accumulate_looks(dtype: DTypeLike, func_type: str) -> bool:
+    if func_type in ("any", "all"):
+        return dtype == bool
+    # Integer sums/means are upcast by numpy, so leave those to `func`
+    return func_type in _LOOKS_UFUNCS and np.issubdtype(dtype, np.inexact)
+
+
+def _accumulate_looks(
+    arr: np.ndarray, row_looks: int, col_looks: int, func_type: str
+) -> np.ndarray:
+    """Reduce blocks of (row_looks, col_looks) by combining strided slices.
+
+    Reducing `arr.reshape(new_rows, row_looks, new_cols, col_looks)` over
+    axes (3, 1) makes numpy run many tiny reductions along the short looks
+    axes. Here, each of the `row_looks + col_looks` steps is instead a single
+    vectorized pass over a full slice of the image.
+    """
+    ufunc = _LOOKS_UFUNCS[func_type]
+    rows, cols = arr.shape[-2:]
+    new_rows, new_cols = rows // row_looks, cols // col_looks
+    blocks = arr.reshape(*arr.shape[:-2], new_rows, row_looks, new_cols, col_looks)
+
+    skip_nan = func_type in ("nansum", "nanmean")
+    # Combine the row looks, then the column looks of the result
+    out = _accumulate(ufunc, [blocks[..., i, :, :] for i in range(row_looks)], skip_nan)
+    out = _accumulate(ufunc, [out[..., j] for j in range(col_looks)])
+
+    if func_type == "mean":
+        out /= row_looks * col_looks
+    elif func_type == "nanmean":
+        count = _accumulate_looks(
+            (~np.isnan(arr)).astype(np.int32), row_looks, col_looks, "sum"
         )
+        out /= count
+    return out
+
+
+def _accumulate(ufunc: np.ufunc, slices: list, skip_nan: bool = False) -> np.ndarray:
+    if skip_nan:
+        out = np.zeros(slices[0].shape, dtype=slices[0].dtype)
+        for s in slices:
+            ufunc(out, s, out=out, where=~np.isnan(s))
+        return out
+    out = slices[0].copy()
+    for s in slices[1:]:
+        ufunc(out, s, out=out)
+    return out
 
 
 def _make_dims_multiples(arr, row_looks, col_looks, how="cutoff"):
-    """Pad or cutoff an array to make the dimensions multiples of the looks."""
-    rows, cols = arr.shape
+    """Pad or cutoff the last two dimensions to make them multiples of the looks."""
+    rows, cols = arr.shape[-2:]
     row_cutoff = rows % row_looks
     col_cutoff = cols % col_looks
     if how == "cutoff":
-        if row_cutoff != 0:
-            arr = arr[:-row_cutoff, :]
-        if col_cutoff != 0:
-            arr = arr[:, :-col_cutoff]
-        return arr
+        # Slicing returns a view, so there's no copy for any leading dimensions
+        return arr[..., : rows - row_cutoff, : cols - col_cutoff]
     elif how == "pad":
         pad_rows = (row_looks - row_cutoff) % row_looks
         pad_cols = (col_looks - col_cutoff) % col_looks
@@ -263,7 +331,7 @@ def _make_dims_multiples(arr, row_looks, col_looks, how="cutoff"):
         if pad_rows > 0 or pad_cols > 0:
             arr = np.pad(
                 arr,
-                ((0, pad_rows), (0, pad_cols)),
+                ((0, 0),) * (arr.ndim - 2) + ((0, pad_rows), (0, pad_cols)),
                 mode="constant",
                 constant_values=pad_val,
             )
@@ -295,6 +363,11 @@ def upsample_nearest(
     ndarray
         The upsampled array, shape = `output_shape`.
 
+    Raises
+    ------
+    ValueError
+        If `looks` is not provided and `output_shape` is smaller than `arr`.
+
     """
     in_rows, in_cols = arr.shape[-2:]
     out_rows, out_cols = output_shape[-2:]
@@ -304,18 +377,37 @@ def upsample_nearest(
     if looks is None:
         row_looks = out_rows // in_rows
         col_looks = out_cols // in_cols
+        if row_looks == 0 or col_looks == 0:
+            msg = (
+                f"Cannot infer looks: output shape {(out_rows, out_cols)} is smaller"
+                f" than input shape {(in_rows, in_cols)}. Pass `looks` explicitly."
+            )
+            raise ValueError(msg)
     else:
         row_looks, col_looks = looks
 
-    arr_up = np.repeat(np.repeat(arr, row_looks, axis=-2), col_looks, axis=-1)
-    # This may be larger than the original array, or it may be smaller, depending
-    # on whether it was padded or cutoff
-    out_r = min(out_rows, arr_up.shape[-2])
-    out_c = min(out_cols, arr_up.shape[-1])
+    # The upsampled array may be larger than the original array, or it may be
+    # smaller, depending on whether it was padded or cutoff
+    out_r = min(out_rows, in_rows * row_looks)
+    out_c = min(out_cols, in_cols * col_looks)
 
     shape = (len(arr), out_rows, out_cols) if arr.ndim == 3 else (out_rows, out_cols)
     arr_out = np.zeros(shape=shape, dtype=arr.dtype)
-    arr_out[..., :out_r, :out_c] = arr_up[..., :out_r, :out_c]
+
+    # Write the complete (row_looks, col_looks) blocks through a 4D view of the
+    # output, broadcasting each input pixel instead of making repeated copies
+    full_r, full_c = out_r // row_looks, out_c // col_looks
+    out_blocks = arr_out[..., : full_r * row_looks, : full_c * col_looks].reshape(
+        *arr.shape[:-2], full_r, row_looks, full_c, col_looks
+    )
+    out_blocks[...] = arr[..., :full_r, None, :full_c, None]
+    # Fill any partial blocks along the bottom/right edges
+    if out_r > full_r * row_looks:
+        edge_row = np.repeat(arr[..., full_r : full_r + 1, :], col_looks, axis=-1)
+        arr_out[..., full_r * row_looks : out_r, :out_c] = edge_row[..., :out_c]
+    if out_c > full_c * col_looks:
+        edge_col = np.repeat(arr[..., :, full_c : full_c + 1], row_looks, axis=-2)
+        arr_out[..., :out_r, full_c * col_looks : out_c] = edge_col[..., :out_r, :]
     return arr_out
 
 
@@ -429,12 +521,14 @@ def set_num_threads(num_threads: int):
     os.environ["XLA_FLAGS"] = f"--xla_force_host_platform_device_count={num_threads}"
 
 
-def get_cpu_count():
+def get_cpu_count() -> int:
     """Get the number of CPUs available to the current process.
 
     This function accounts for the possibility of a Docker container with
     limited CPU resources on a larger machine (which is ignored by
     `multiprocessing.cpu_count()`).
+    The CPUs the process is allowed to run on (e.g. set by `taskset` or a
+    cgroup cpuset) are further limited by any cgroup v2 or v1 CPU quota.
 
     Returns
     -------
@@ -447,21 +541,36 @@ def get_cpu_count():
     2. https://github.com/conan-io/conan/blob/982a97041e1ece715d157523e27a14318408b925/conans/client/tools/oss.py#L27 # noqa
 
     """  # noqa: E501
+    try:
+        num_cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # Not available on macOS/Windows
+        num_cpus = cpu_count()
 
-    def get_cpu_quota():
-        return int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+    quota = _get_cgroup_cpu_quota()
+    if quota is not None:
+        num_cpus = min(num_cpus, max(1, math.ceil(quota)))
+    return num_cpus
 
-    def get_cpu_period():
-        return int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
 
+def _get_cgroup_cpu_quota() -> Optional[float]:
+    """Get the CPU quota of the current cgroup, or None if there is no limit."""
+    try:
+        # cgroup v2: "$MAX $PERIOD", where $MAX is "max" for no limit
+        quota, period = Path("/sys/fs/cgroup/cpu.max").read_text().split()
+    except (OSError, ValueError):
+        pass
+    else:
+        return None if quota == "max" else int(quota) / int(period)
     try:
-        cfs_quota_us = get_cpu_quota()
-        cfs_period_us = get_cpu_period()
+        # cgroup v1: a quota of -1 means no limit
+        cfs_quota_us = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_quota_us").read_text())
+        cfs_period_us = int(Path("/sys/fs/cgroup/cpu/cpu.cfs_period_us").read_text())
         if cfs_quota_us > 0 and cfs_period_us > 0:
-            return int(math.ceil(cfs_quota_us / cfs_period_us))
-    except Exception:
+            return cfs_quota_us / cfs_period_us
+    except (OSError, ValueError):
         pass
-    return cpu_count()
+    return None
 
 
 def flatten(list_of_lists: Iterable[Iterable[Any]]) -> chain[Any]:
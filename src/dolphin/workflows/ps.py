@@ -75,6 +75,8 @@ def run(
         input_file_list,
         subdataset=subdataset,
         outfile=cfg.work_directory / "slc_stack.vrt",
+        # Read the SLCs for each block in parallel
+        num_threads=cfg.worker_settings.threads_per_worker,
     )
 
     # Make the nodata mask from the polygons, if we're using OPERA CSLCs
@@ -96,6 +98,8 @@ def run(
         like_filename=vrt_stack.outfile,
         amp_dispersion_threshold=cfg.ps_options.amp_dispersion_threshold,
         block_shape=cfg.worker_settings.block_shape,
+        num_threads=cfg.worker_settings.threads_per_worker,
+        use_gpu=cfg.worker_settings.gpu_enabled,
     )
     # Save a looked version of the PS mask too
     strides = cfg.output_options.strides
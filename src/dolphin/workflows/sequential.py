@@ -5,12 +5,12 @@ Initially based on [@Ansari2017SequentialEstimatorEfficient].
 
 from __future__ import annotations
 
+import warnings
 from itertools import chain
-from os import fspath
 from pathlib import Path
 from typing import Optional
 
-from osgeo_utils import gdal_calc
+import numpy as np
 
 from dolphin import io
 from dolphin._log import get_log
@@ -124,21 +124,9 @@ def run_wrapped_phase_sequential(
     # Average the temporal coherence files in each ministack
     full_span = ministack_planner.real_slc_date_range_str
     output_temp_coh_file = output_folder / f"temporal_coherence_average_{full_span}.tif"
-    # we can pass the list of files to gdal_calc, which interprets it
-    # as a multi-band file
     if len(temp_coh_files) > 1:
         logger.info(f"Averaging temporal coherence files into: {output_temp_coh_file}")
-        gdal_calc.Calc(
-            NoDataValue=0,
-            format="GTiff",
-            outfile=fspath(output_temp_coh_file),
-            type="Float32",
-            quiet=True,
-            overwrite=True,
-            creation_options=io.DEFAULT_TIFF_OPTIONS,
-            A=temp_coh_files,
-            calc="numpy.nanmean(A, axis=0)",
-        )
+        _average_rasters(temp_coh_files, output_temp_coh_file, block_shape=block_shape)
     else:
         temp_coh_files[0].rename(output_temp_coh_file)
 
@@ -159,6 +147,39 @@ def run_wrapped_phase_sequential(
     return out_pl_slcs, comp_outputs, output_temp_coh_file
 
 
+def _average_rasters(
+    file_list: list[Path], output_file: Path, block_shape: tuple[int, int]
+):
+    """Average single-band rasters block-by-block, ignoring NaNs.
+
+    Pixels which are nodata (0) in any input are set to 0 in `output_file`.
+    """
+    io.write_arr(
+        arr=None,
+        like_filename=file_list[0],
+        output_name=output_file,
+        dtype=np.float32,
+        nbands=1,
+        nodata=0,
+    )
+    reader = io.RasterStackReader.from_file_list(file_list)
+    writer = io.BackgroundRasterWriter(output_file)
+
+    def calc_average(readers, rows, cols):
+        # The reader squeezes singleton dimensions, so restore edge blocks to 3D
+        shape_2d = (rows.stop - rows.start, cols.stop - cols.start)
+        block = readers[0][:, rows, cols].reshape(-1, *shape_2d)
+        with warnings.catch_warnings():
+            # ignore the warning about nanmean of empty slice
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            out = np.nanmean(block, axis=0)
+        out[(block == 0).any(axis=0)] = 0
+        return out, rows, cols
+
+    io.process_blocks([reader], writer, func=calc_average, block_shape=block_shape)
+    writer.notify_finished()
+
+
 def _get_outputs_from_folder(output_folder: Path):
     cur_output_files = sorted(output_folder.glob("2*.slc.tif"))
     cur_comp_slc_file = next(output_folder.glob("compressed_*"))
@@ -92,6 +92,8 @@ def run(
             existing_amp_dispersion_file=existing_disp,
             existing_amp_mean_file=existing_amp,
             block_shape=cfg.worker_settings.block_shape,
+            num_threads=cfg.worker_settings.threads_per_worker,
+            use_gpu=cfg.worker_settings.gpu_enabled,
             **kwargs,
         )
 
@@ -314,6 +314,39 @@ def test_read_stack(vrt_stack, slc_stack):
     assert data.shape == vrt_stack.shape
 
 
+def test_read_stack_threaded(tmp_path, slc_file_list, slc_stack):
+    vrt_file = tmp_path / "test_threaded.vrt"
+    v = VRTStack(slc_file_list, outfile=vrt_file, num_threads=2)
+    data = v[:, 1:4, 2:8]
+    npt.assert_array_almost_equal(data, slc_stack[:, 1:4, 2:8])
+
+
+def test_read_stack_threaded_masked(tmp_path, slc_file_list, slc_stack):
+    # Mark one pixel in each file as nodata
+    for f in slc_file_list:
+        ds = gdal.Open(str(f), gdal.GA_Update)
+        bnd = ds.GetRasterBand(1)
+        bnd.SetNoDataValue(0)
+        bnd.WriteArray(np.zeros((1, 1), dtype=np.complex64), 3, 2)
+        ds = None
+    expected_mask = np.zeros(slc_stack.shape, dtype=bool)
+    expected_mask[:, 2, 3] = True
+
+    v_single = VRTStack(
+        slc_file_list, outfile=tmp_path / "single.vrt", read_masked=True
+    )
+    v_threaded = VRTStack(
+        slc_file_list,
+        outfile=tmp_path / "threaded.vrt",
+        read_masked=True,
+        num_threads=2,
+    )
+    for v in [v_single, v_threaded]:
+        data = v[:, 1:4, 2:8]
+        assert isinstance(data, np.ma.MaskedArray)
+        npt.assert_array_equal(data.mask, expected_mask[:, 1:4, 2:8])
+
+
 def test_read_stack_nc(vrt_stack_nc, slc_stack):
     ds = gdal.Open(str(vrt_stack_nc.outfile))
     loaded = ds.ReadAsArray()
@@ -153,6 +153,43 @@ def test_strides_window_sizes(strides, half_window, shape):
     )
 
 
+@pytest.mark.parametrize(
+    ("strides", "shape"),
+    [
+        *[
+            (strides, shape)
+            for strides in [(1, 1), (2, 2), (3, 6)]
+            for shape in [(15, 20), (4, 15, 20)]
+        ],
+        # Strides larger than the array give an empty output
+        ((3, 6), (3, 3)),
+        ((7, 7), (2, 5, 5)),
+        ((2, 2), (3, 1, 7)),
+    ],
+)
+def test_decimate_contiguous(strides, shape):
+    data = np.random.normal(0, 1, size=shape).astype(np.complex64)
+    expected = _core.decimate(data, Strides(*strides))
+    out = _core.decimate(data, Strides(*strides), contiguous=True)
+    assert out.flags.c_contiguous
+    npt.assert_array_equal(out, expected)
+
+
+def test_decimate_contiguous_4d():
+    data = np.ones((2, 3, 15, 20), dtype=np.complex64)
+    # The strided view is still returned without a copy
+    assert _core.decimate(data, Strides(2, 2)).base is data
+    with pytest.raises(ValueError, match="2D or 3D numpy array"):
+        _core.decimate(data, Strides(2, 2), contiguous=True)
+
+
+def test_decimate_contiguous_jax():
+    jnp = pytest.importorskip("jax.numpy")
+    data = jnp.ones((15, 20), dtype=jnp.complex64)
+    with pytest.raises(ValueError, match="2D or 3D numpy array"):
+        _core.decimate(data, Strides(2, 2), contiguous=True)
+
+
 @pytest.mark.parametrize("strides", [1, 2, 3, 4])
 def test_ps_fill(slc_samples, strides):
     rows, cols = 11, 11
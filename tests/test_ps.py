@@ -1,9 +1,16 @@
+import os
+
 import numpy as np
+import numpy.testing as npt
 import pytest
 from osgeo import gdal
 
+import dolphin._ps_kernels
 import dolphin.ps
 from dolphin import io
+from dolphin.utils import gpu_is_available
+
+GPU_AVAILABLE = gpu_is_available() and os.environ.get("NUMBA_DISABLE_JIT") != "1"
 
 
 def test_ps_block(slc_stack):
@@ -48,12 +55,145 @@ def test_ps_threshold(slc_stack):
     assert ps_pixels.sum() == 0
 
 
+def _run_ps_kernel(stack, threshold=0.6, kernel=dolphin._ps_kernels.ps_block):
+    """Allocate the 2D outputs and run `kernel` over all bands of `stack`."""
+    shape2d = stack.shape[1:]
+    mean = np.empty(shape2d, dtype=np.float32)
+    amp_disp = np.empty(shape2d, dtype=np.float32)
+    ps = np.empty(shape2d, dtype=np.uint8)
+    kernel(stack, threshold, len(stack), 255, mean, amp_disp, ps)
+    return mean, amp_disp, ps
+
+
+def test_ps_kernel_matches_numpy(slc_stack):
+    s_nan = slc_stack.copy()
+    s_nan[:, 0, 0] = np.nan
+    s_nan[3, 1, 1] = np.nan
+    mean, amp_disp, ps = _run_ps_kernel(s_nan, 0.6)
+
+    mag = np.abs(s_nan[:, 2:])
+    expected_mean = mag.mean(axis=0)
+    expected_amp_disp = mag.std(axis=0) / expected_mean
+    npt.assert_allclose(mean[2:], expected_mean, rtol=1e-5)
+    npt.assert_allclose(amp_disp[2:], expected_amp_disp, rtol=1e-4)
+    npt.assert_array_equal(ps[2:], expected_amp_disp < 0.6)
+    # Pixels missing any band are nodata
+    assert mean[0, 0] == 0
+    assert amp_disp[0, 0] == amp_disp[1, 1] == 0
+    assert ps[0, 0] == ps[1, 1] == 255
+
+
+@pytest.mark.parametrize("fill_value", [0, np.nan])
+def test_ps_kernel_empty_block(slc_stack, fill_value):
+    empty = np.full_like(slc_stack, fill_value)
+    mean, amp_disp, ps = _run_ps_kernel(empty, 0.6)
+    assert (mean == dolphin.ps.NODATA_VALUES["amp_mean"]).all()
+    assert (amp_disp == dolphin.ps.NODATA_VALUES["amp_dispersion"]).all()
+    assert (ps == dolphin.ps.NODATA_VALUES["ps"]).all()
+
+
+def test_ps_kernel_multiple_tiles():
+    # Use a shape which doesn't evenly divide into the kernel's tiles
+    tile_rows, tile_cols = dolphin._ps_kernels.TILE_SHAPE
+    shape = (5, 2 * tile_rows + 3, tile_cols + 7)
+    rng = np.random.default_rng(1234)
+    amp_stack = rng.rayleigh(size=shape).astype(np.float32)
+    mean, amp_disp, _ = _run_ps_kernel(amp_stack, 0.3)
+
+    npt.assert_allclose(mean, amp_stack.mean(axis=0), rtol=1e-5)
+    npt.assert_allclose(amp_disp, amp_stack.std(axis=0) / mean, rtol=1e-4)
+
+
+@pytest.mark.skipif(not GPU_AVAILABLE, reason="GPU not available")
+@pytest.mark.filterwarnings("ignore::numba.core.errors.NumbaPerformanceWarning")
+def test_ps_kernel_gpu(slc_stack):
+    outputs_cpu = _run_ps_kernel(slc_stack, 0.6)
+    outputs_gpu = _run_ps_kernel(
+        slc_stack, 0.6, kernel=dolphin._ps_kernels.ps_block_gpu
+    )
+    for cpu, gpu in zip(outputs_cpu, outputs_gpu):
+        npt.assert_allclose(cpu, gpu, rtol=1e-5)
+
+
+def test_merge_amp_stats():
+    rng = np.random.default_rng(1234)
+    amp_stack = rng.rayleigh(size=(10, 4, 5)).astype(np.float32)
+    mean_a, amp_disp_a, _ = dolphin.ps.calc_ps_block(amp_stack[:7])
+    mean_b, amp_disp_b, _ = dolphin.ps.calc_ps_block(amp_stack[7:])
+    mean, amp_disp = dolphin.ps._merge_amp_stats(
+        mean_a, amp_disp_a, 7, mean_b, amp_disp_b, 3
+    )
+    npt.assert_allclose(mean, amp_stack.mean(axis=0), rtol=1e-5)
+    npt.assert_allclose(
+        amp_disp, amp_stack.std(axis=0) / amp_stack.mean(axis=0), rtol=1e-4
+    )
+
+
 @pytest.fixture()
 def vrt_stack(tmp_path, slc_file_list):
     vrt_file = tmp_path / "test.vrt"
     return io.VRTStack(slc_file_list, outfile=vrt_file)
 
 
+@pytest.mark.parametrize(
+    ("chunk_sizes", "expected"),
+    [
+        ([[128, 128]], (512, 512)),
+        ([[100, 50]], (500, 500)),
+        # Output tiles of 128, input chunks of (x=96, y=192)
+        ([[128, 128], [96, 192]], (384, 384)),
+        # The common multiple of 128 and 160 is too large: rows are unchanged
+        ([[128, 128], [128, 160]], (512, 512)),
+        # Strips: whole rows can't fit in a block, so the columns are unchanged
+        ([[4000, 1]], (512, 512)),
+        ([[4000, 16], [128, 128]], (512, 512)),
+    ],
+)
+def test_align_block_shape(chunk_sizes, expected):
+    assert dolphin.ps._align_block_shape((512, 512), chunk_sizes) == expected
+
+
+def test_masked_to_nan():
+    data = np.ones((3, 4, 5), dtype=np.complex64)
+    mask = np.zeros(data.shape, dtype=bool)
+    mask[1, 2, 3] = True
+    block = np.ma.MaskedArray(data, mask=mask)
+
+    out = dolphin.ps._masked_to_nan(block)
+    # Filled in place, without copying the block
+    assert not isinstance(out, np.ma.MaskedArray)
+    assert np.shares_memory(out, data)
+    assert np.isnan(out[1, 2, 3])
+    assert np.isnan(out).sum() == 1
+
+    # Read-only blocks get copied instead
+    data = np.ones((3, 4, 5), dtype=np.complex64)
+    data.flags.writeable = False
+    out = dolphin.ps._masked_to_nan(np.ma.MaskedArray(data, mask=mask))
+    assert not np.shares_memory(out, data)
+    assert np.isnan(out[1, 2, 3])
+
+    plain = np.ones((3, 4, 5), dtype=np.complex64)
+    assert dolphin.ps._masked_to_nan(plain) is plain
+
+
+def test_gdal_block_io_settings(vrt_stack):
+    old_cache_max = gdal.GetCacheMax()
+    old_num_threads = gdal.GetConfigOption("GDAL_NUM_THREADS")
+    # Defaults leave GDAL's settings alone
+    with dolphin.ps._gdal_block_io_settings(vrt_stack, (512, 512)):
+        assert gdal.GetCacheMax() == old_cache_max
+        assert gdal.GetConfigOption("GDAL_NUM_THREADS") == old_num_threads
+
+    with dolphin.ps._gdal_block_io_settings(
+        vrt_stack, (512, 512), num_threads=2, max_cache_bytes=2**30
+    ):
+        assert gdal.GetCacheMax() >= old_cache_max
+        assert gdal.GetConfigOption("GDAL_NUM_THREADS") is not None
+    assert gdal.GetCacheMax() == old_cache_max
+    assert gdal.GetConfigOption("GDAL_NUM_THREADS") == old_num_threads
+
+
 def test_create_ps(tmp_path, vrt_stack):
     ps_mask_file = tmp_path / "ps_pixels.tif"
 
@@ -71,6 +211,99 @@ def test_create_ps(tmp_path, vrt_stack):
     assert io.get_raster_dtype(amp_dispersion_file) == np.float32
 
 
+def test_create_ps_update_existing(tmp_path, vrt_stack):
+    existing_amp_dispersion_file = tmp_path / "amp_disp_existing.tif"
+    existing_amp_mean_file = tmp_path / "amp_mean_existing.tif"
+    dolphin.ps.create_ps(
+        reader=vrt_stack,
+        like_filename=vrt_stack.outfile,
+        output_amp_dispersion_file=existing_amp_dispersion_file,
+        output_amp_mean_file=existing_amp_mean_file,
+        output_file=tmp_path / "ps_pixels_existing.tif",
+    )
+    assert io.get_raster_metadata(existing_amp_dispersion_file)["N"] == str(
+        len(vrt_stack)
+    )
+
+    # Combining the stack with itself keeps the same mean and dispersion
+    amp_dispersion_file = tmp_path / "amp_disp.tif"
+    amp_mean_file = tmp_path / "amp_mean.tif"
+    dolphin.ps.create_ps(
+        reader=vrt_stack,
+        like_filename=vrt_stack.outfile,
+        output_amp_dispersion_file=amp_dispersion_file,
+        output_amp_mean_file=amp_mean_file,
+        output_file=tmp_path / "ps_pixels.tif",
+        existing_amp_mean_file=existing_amp_mean_file,
+        existing_amp_dispersion_file=existing_amp_dispersion_file,
+        update_existing=True,
+    )
+    assert io.get_raster_metadata(amp_dispersion_file)["N"] == str(2 * len(vrt_stack))
+    npt.assert_allclose(
+        io.load_gdal(amp_dispersion_file),
+        io.load_gdal(existing_amp_dispersion_file),
+        rtol=1e-4,
+    )
+    npt.assert_allclose(
+        io.load_gdal(amp_mean_file), io.load_gdal(existing_amp_mean_file), rtol=1e-5
+    )
+
+
+def test_create_ps_update_existing_no_count(tmp_path, vrt_stack):
+    # Files from older versions have no "N" metadata
+    existing_amp_dispersion_file = tmp_path / "amp_disp_existing.tif"
+    existing_amp_mean_file = tmp_path / "amp_mean_existing.tif"
+    shape2d = vrt_stack.shape[1:]
+    for fn in [existing_amp_dispersion_file, existing_amp_mean_file]:
+        io.write_arr(
+            arr=np.ones(shape2d, dtype=np.float32),
+            like_filename=vrt_stack.outfile,
+            output_name=fn,
+        )
+
+    ps_mask_file = tmp_path / "ps_pixels.tif"
+    with pytest.raises(ValueError, match="'N'"):
+        dolphin.ps.create_ps(
+            reader=vrt_stack,
+            like_filename=vrt_stack.outfile,
+            output_amp_dispersion_file=tmp_path / "amp_disp.tif",
+            output_amp_mean_file=tmp_path / "amp_mean.tif",
+            output_file=ps_mask_file,
+            existing_amp_mean_file=existing_amp_mean_file,
+            existing_amp_dispersion_file=existing_amp_dispersion_file,
+            update_existing=True,
+        )
+    # No partial outputs are left behind
+    assert not ps_mask_file.exists()
+
+
+def test_create_ps_use_existing(tmp_path, vrt_stack):
+    existing_ps_file = tmp_path / "ps_pixels_existing.tif"
+    existing_amp_dispersion_file = tmp_path / "amp_disp_existing.tif"
+    existing_amp_mean_file = tmp_path / "amp_mean_existing.tif"
+    dolphin.ps.create_ps(
+        reader=vrt_stack,
+        like_filename=vrt_stack.outfile,
+        output_amp_dispersion_file=existing_amp_dispersion_file,
+        output_amp_mean_file=existing_amp_mean_file,
+        output_file=existing_ps_file,
+    )
+
+    # The PS mask is re-made block-by-block from the existing dispersion
+    ps_mask_file = tmp_path / "ps_pixels.tif"
+    dolphin.ps.create_ps(
+        reader=vrt_stack,
+        like_filename=vrt_stack.outfile,
+        output_amp_dispersion_file=tmp_path / "amp_disp.tif",
+        output_amp_mean_file=tmp_path / "amp_mean.tif",
+        output_file=ps_mask_file,
+        existing_amp_mean_file=existing_amp_mean_file,
+        existing_amp_dispersion_file=existing_amp_dispersion_file,
+        block_shape=(128, 128),
+    )
+    npt.assert_array_equal(io.load_gdal(ps_mask_file), io.load_gdal(existing_ps_file))
+
+
 @pytest.fixture()
 def vrt_stack_with_nans(tmp_path, raster_with_nan_block):
     vrt_file = tmp_path / "test_with_nans.vrt"
@@ -1,5 +1,9 @@
+import math
+import warnings
+
 import numpy as np
 import numpy.testing as npt
+import pytest
 
 from dolphin import utils
 
@@ -32,6 +36,26 @@ class TestTakeLooks:
         for i in range(3):
             npt.assert_array_equal(downsampled[i], expected)
 
+    @pytest.mark.parametrize("edge_strategy", ["cutoff", "pad"])
+    def test_3d_matches_2d(self, edge_strategy):
+        arr3d = np.random.default_rng(0).random((3, 7, 9)).astype(np.float32)
+        arr3d[:, ::3, ::2] = np.nan
+        downsampled = utils.take_looks(
+            arr3d, 2, 4, func_type="nanmax", edge_strategy=edge_strategy
+        )
+        for i in range(3):
+            expected = utils.take_looks(
+                arr3d[i], 2, 4, func_type="nanmax", edge_strategy=edge_strategy
+            )
+            npt.assert_array_equal(downsampled[i], expected)
+
+    def test_3d_masked_array(self):
+        arr3d = np.ma.MaskedArray(np.ones((2, 2, 4)), mask=False)
+        arr3d.mask[:, :, :2] = True
+        downsampled = utils.take_looks(arr3d, 2, 2, func_type="nansum")
+        assert type(downsampled) == np.ma.MaskedArray
+        npt.assert_array_equal(downsampled.mask, [[[True, False]], [[True, False]]])
+
     def test_nans(self, slc_samples):
         slc_stack = slc_samples.reshape(30, 11, 11)
         mask = np.zeros((11, 11), dtype=bool)
@@ -46,6 +70,24 @@ class TestTakeLooks:
 
         npt.assert_array_almost_equal(s1, s2, decimal=5)
 
+    @pytest.mark.parametrize(
+        "func_type",
+        ["sum", "nansum", "mean", "nanmean", "max", "nanmax", "min", "nanmin"],
+    )
+    def test_matches_numpy(self, func_type):
+        arr = np.random.default_rng(0).random((37, 53)).astype(np.float32)
+        arr[::3, ::4] = np.nan
+        # An all-nan block
+        arr[:4, :4] = np.nan
+        with np.errstate(invalid="ignore"), warnings.catch_warnings():
+            warnings.simplefilter("ignore", category=RuntimeWarning)
+            expected = getattr(np, func_type)(
+                arr[:36, :52].reshape(9, 4, 13, 4), axis=(3, 1)
+            )
+        downsampled = utils.take_looks(arr, 4, 4, func_type=func_type)
+        assert downsampled.dtype == expected.dtype
+        npt.assert_allclose(downsampled, expected, rtol=1e-6)
+
     def test_masked_array(self):
         arr = np.ma.MaskedArray(
             [[-999, 3, 4, 1 + 1j]], mask=[[True, False, False, False]]
@@ -90,3 +132,97 @@ def test_upsample_nearest():
     assert upsampled3d.shape == (3, 4, 4)
     for img in upsampled3d:
         npt.assert_array_equal(img, upsampled)
+
+
+def _upsample_repeat(arr, output_shape, looks):
+    # Reference: repeat every pixel, then crop or zero-pad to `output_shape`
+    repeated = np.repeat(np.repeat(arr, looks[0], axis=-2), looks[1], axis=-1)
+    out = np.zeros((*arr.shape[:-2], *output_shape), dtype=arr.dtype)
+    r = min(output_shape[0], repeated.shape[-2])
+    c = min(output_shape[1], repeated.shape[-1])
+    out[..., :r, :c] = repeated[..., :r, :c]
+    return out
+
+
+@pytest.mark.parametrize(
+    ("in_shape", "output_shape", "looks"),
+    [
+        ((3, 4), (7, 9), None),  # not a multiple of the input shape
+        ((3, 4), (5, 7), (2, 2)),  # cut off partial blocks
+        ((3, 4), (8, 11), (2, 2)),  # padded beyond in_shape * looks
+        ((2, 3, 4), (7, 9), None),
+        ((2, 3, 4), (5, 7), (2, 2)),
+        ((2, 3, 4), (8, 11), (2, 2)),
+    ],
+)
+def test_upsample_nearest_matches_repeat(in_shape, output_shape, looks):
+    arr = np.arange(np.prod(in_shape), dtype=np.float32).reshape(in_shape) + 1
+    upsampled = utils.upsample_nearest(arr, output_shape=output_shape, looks=looks)
+    if looks is None:
+        looks = (output_shape[0] // in_shape[-2], output_shape[1] // in_shape[-1])
+    assert upsampled.shape == (*in_shape[:-2], *output_shape)
+    npt.assert_array_equal(upsampled, _upsample_repeat(arr, output_shape, looks))
+
+
+def test_upsample_nearest_smaller_output():
+    arr = np.ones((4, 4))
+    with pytest.raises(ValueError, match="Cannot infer looks"):
+        utils.upsample_nearest(arr, output_shape=(2, 8))
+
+
+def test_resolve_gdal_path(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert utils._resolve_gdal_path("slc.tif") == tmp_path / "slc.tif"
+    assert utils._resolve_gdal_path('"slc.tif"') == tmp_path / "slc.tif"
+    assert (
+        utils._resolve_gdal_path('NETCDF:"slc.nc":data')
+        == f'NETCDF:"{tmp_path / "slc.nc"}":data'
+    )
+    assert (
+        utils._resolve_gdal_path("DERIVED_SUBDATASET:AMPLITUDE:slc.tif")
+        == f"DERIVED_SUBDATASET:AMPLITUDE:{tmp_path / 'slc.tif'}"
+    )
+
+    # Relative paths resolve against the new directory after a `chdir`
+    subdir = tmp_path / "sub"
+    subdir.mkdir()
+    monkeypatch.chdir(subdir)
+    assert utils._resolve_gdal_path("slc.tif") == subdir / "slc.tif"
+
+
+@pytest.mark.parametrize(
+    ("cgroup_files", "expected"),
+    [
+        ({}, None),
+        ({"/sys/fs/cgroup/cpu.max": "max 100000\n"}, None),
+        ({"/sys/fs/cgroup/cpu.max": "250000 100000\n"}, 2.5),
+        (
+            {
+                "/sys/fs/cgroup/cpu/cpu.cfs_quota_us": "200000\n",
+                "/sys/fs/cgroup/cpu/cpu.cfs_period_us": "100000\n",
+            },
+            2.0,
+        ),
+        (
+            {
+                "/sys/fs/cgroup/cpu/cpu.cfs_quota_us": "-1\n",
+                "/sys/fs/cgroup/cpu/cpu.cfs_period_us": "100000\n",
+            },
+            None,
+        ),
+    ],
+)
+def test_get_cgroup_cpu_quota(monkeypatch, cgroup_files, expected):
+    def read_text(self, *args, **kwargs):
+        try:
+            return cgroup_files[str(self)]
+        except KeyError:
+            raise FileNotFoundError(self) from None
+
+    monkeypatch.setattr(utils.Path, "read_text", read_text)
+    assert utils._get_cgroup_cpu_quota() == expected
+
+    monkeypatch.setattr(
+        utils.os, "sched_getaffinity", lambda _: {0, 1, 2, 3}, raising=False
+    )
+    assert utils.get_cpu_count() == (4 if expected is None else math.ceil(expected))
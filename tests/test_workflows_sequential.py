@@ -1,6 +1,8 @@
+import numpy as np
+import numpy.testing as npt
 import pytest
 
-from dolphin import stack
+from dolphin import io, stack
 
 # from dolphin._types import HalfWindow, Strides
 from dolphin.io import _readers
@@ -128,3 +130,33 @@ def test_sequential_ministack_sizes(tmp_path, slc_file_list_nc, ministack_size):
         shp_alpha=None,
         shp_nslc=None,
     )
+
+
+@pytest.mark.parametrize("block_shape", [(2, 3), (512, 512)])
+def test_average_rasters(tmp_path, block_shape):
+    rng = np.random.default_rng(1234)
+    # (2, 3) blocks leave 1-row, 1-column and 1-pixel blocks on the edges
+    arrays = rng.uniform(1, 2, size=(3, 5, 7)).astype(np.float32)
+    arrays[0, 0, 0] = np.nan  # NaNs are ignored in the average
+    arrays[:, 2, 2] = np.nan  # unless all inputs are NaN
+    arrays[1, 1, 1] = 0  # nodata in any input is nodata in the output
+    arrays[2, 4, 6] = 0  # corner (edge) block
+    arrays[0, 4, 3] = 0  # bottom edge block
+
+    file_list = []
+    for i, arr in enumerate(arrays):
+        fn = tmp_path / f"temp_coh_{i}.tif"
+        io.write_arr(arr=arr, output_name=fn)
+        file_list.append(fn)
+    output_file = tmp_path / "average.tif"
+    sequential._average_rasters(file_list, output_file, block_shape=block_shape)
+
+    with np.errstate(invalid="ignore"), pytest.warns(RuntimeWarning):
+        expected = np.nanmean(arrays, axis=0)
+    expected[(arrays == 0).any(axis=0)] = 0
+    out = io.load_gdal(output_file)
+    assert out.shape == (5, 7)
+    npt.assert_allclose(out, expected, rtol=1e-6)
+    assert out[0, 0] == pytest.approx(arrays[1:, 0, 0].mean())
+    assert np.isnan(out[2, 2])
+    assert out[1, 1] == out[4, 6] == out[4, 3] == 0